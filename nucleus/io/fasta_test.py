@@ -18,6 +18,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+import itertools
+
 from absl.testing import absltest
 from absl.testing import parameterized
 
@@ -27,16 +30,63 @@ from nucleus.io.python import reference
 from nucleus.testing import test_utils
 from nucleus.util import ranges
 
+# Memoized testdata path lookup, shared by every test in this module.
+_td = functools.lru_cache(maxsize=None)(test_utils.genomics_core_testdata)
+
+# Parameters for the InMemoryFastaReaderTests, built once at module scope.
+_IS_VALID_PARAMS = (
+    ('chr1_start', ranges.make_range('chr1', 0, 10), True),
+    ('chr1_middle', ranges.make_range('chr1', 10, 50), True),
+    ('off_end', ranges.make_range('chr1', 10, 500), False),
+    ('unknown_contig', ranges.make_range('chr3', 10, 20), False),
+)
+
+_BAD_QUERY_RANGES = (
+    ('bad_start', ranges.make_range('chr1', -1, 10)),
+    ('end_before_start', ranges.make_range('chr1', 10, 1)),
+    ('off_end', ranges.make_range('chr1', 0, 1000)),
+    ('unknown_contig', ranges.make_range('unknown', 0, 10)),
+)
+
+# Names of the InMemoryFastaReaderTests attributes holding the readers under
+# test.
+_READER_NAMES = ('fasta_reader', 'in_mem')
+
+
+def _per_reader(named_cases):
+  """Returns named_parameters cases for each of the readers under test.
+
+  Args:
+    named_cases: iterable of tuples. The first element of each tuple is the
+      case name; the remaining elements are the arguments for the test.
+
+  Returns:
+    A list of tuples (test name, reader name, *arguments), where the test name
+    combines the reader name with the case name.
+  """
+  return [('{}_{}'.format(reader_name, case[0]), reader_name) + tuple(case[1:])
+          for reader_name in _READER_NAMES
+          for case in named_cases]
+
+
+@functools.lru_cache(maxsize=None)
+def _iter_indexed(fasta_filename):
+  """Returns the (name, bases) records of an indexed testdata FASTA file.
+
+  The records are cached for the lifetime of the test process and returned as a
+  tuple so callers can't mutate the shared value.
+  """
+  with fasta.IndexedFastaReader(_td(fasta_filename)) as reader:
+    return tuple(reader.iterate())
+
 
 class FastaReaderTests(parameterized.TestCase):
 
   def test_dispatching_reader(self):
-    with fasta.FastaReader(
-        test_utils.genomics_core_testdata('test.fasta')) as reader:
+    with fasta.FastaReader(_td('test.fasta')) as reader:
       # The reader is an instance of IndexedFastaReader which supports query().
       self.assertEqual(reader.query(ranges.make_range('chrM', 1, 6)), 'ATCAC')
-    with fasta.FastaReader(
-        test_utils.genomics_core_testdata('unindexed.fasta')) as reader:
+    with fasta.FastaReader(_td('unindexed.fasta')) as reader:
       # The reader is an instance of UnindexedFastaReader which doesn't support
       # query().
       with self.assertRaises(NotImplementedError):
@@ -45,70 +95,86 @@ class FastaReaderTests(parameterized.TestCase):
 
 class IndexedFastaReaderTests(parameterized.TestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    cls._readers = {
+        fn: fasta.IndexedFastaReader(_td(fn))
+        for fn in ('test.fasta', 'test.fasta.gz')
+    }
+
+  @classmethod
+  def tearDownClass(cls):
+    for reader in cls._readers.values():
+      reader.__exit__(None, None, None)
+
   @parameterized.parameters('test.fasta', 'test.fasta.gz')
   def test_make_ref_reader_default(self, fasta_filename):
-    fasta_path = test_utils.genomics_core_testdata(fasta_filename)
-    with fasta.IndexedFastaReader(fasta_path) as reader:
-      self.assertEqual(reader.query(ranges.make_range('chrM', 1, 6)), 'ATCAC')
+    reader = self._readers[fasta_filename]
+    self.assertEqual(reader.query(ranges.make_range('chrM', 1, 6)), 'ATCAC')
 
   @parameterized.parameters('test.fasta', 'test.fasta.gz')
   def test_make_ref_reader_cache_specified(self, fasta_filename):
-    fasta_path = test_utils.genomics_core_testdata(fasta_filename)
-    with fasta.IndexedFastaReader(fasta_path, cache_size=10) as reader:
+    with fasta.IndexedFastaReader(
+        _td(fasta_filename), cache_size=10) as reader:
       self.assertEqual(reader.query(ranges.make_range('chrM', 1, 5)), 'ATCA')
 
   def test_c_reader(self):
-    with fasta.IndexedFastaReader(
-        test_utils.genomics_core_testdata('test.fasta')) as reader:
-      self.assertIsInstance(reader.c_reader,
-                            reference.IndexedFastaReader)
+    self.assertIsInstance(self._readers['test.fasta'].c_reader,
+                          reference.IndexedFastaReader)
 
 
 class UnindexedFastaReaderTests(parameterized.TestCase):
 
   def test_query(self):
-    unindexed_fasta_reader = fasta.UnindexedFastaReader(
-        test_utils.genomics_core_testdata('unindexed.fasta'))
-    with self.assertRaises(NotImplementedError):
-      unindexed_fasta_reader.query(ranges.make_range('chrM', 1, 5))
+    with fasta.UnindexedFastaReader(
+        _td('unindexed.fasta')) as unindexed_fasta_reader:
+      with self.assertRaises(NotImplementedError):
+        unindexed_fasta_reader.query(ranges.make_range('chrM', 1, 5))
 
   @parameterized.parameters('test.fasta', 'test.fasta.gz')
   def test_iterate(self, fasta_filename):
     # Check the indexed fasta file's iterable matches that of the unindexed
-    # fasta file.
-    indexed_fasta_reader = fasta.IndexedFastaReader(
-        test_utils.genomics_core_testdata(fasta_filename))
-    unindexed_fasta_reader = fasta.UnindexedFastaReader(
-        test_utils.genomics_core_testdata(fasta_filename))
-    self.assertEqual(
-        list(indexed_fasta_reader.iterate()),
-        list(unindexed_fasta_reader.iterate()))
+    # fasta file. The indexed records come from the module-level cache; only
+    # the unindexed side is streamed.
+    with fasta.UnindexedFastaReader(
+        _td(fasta_filename)) as unindexed_fasta_reader:
+      for indexed_record, unindexed_record in itertools.zip_longest(
+          _iter_indexed(fasta_filename),
+          unindexed_fasta_reader.iterate(),
+          fillvalue=None):
+        self.assertEqual(indexed_record, unindexed_record)
 
 
 class InMemoryFastaReaderTests(parameterized.TestCase):
 
   @classmethod
   def setUpClass(cls):
-    cls.fasta_reader = fasta.IndexedFastaReader(
-        test_utils.genomics_core_testdata('test.fasta'))
+    cls.fasta_reader = fasta.IndexedFastaReader(_td('test.fasta'))
 
     cls.in_mem = fasta.InMemoryFastaReader(
-        [(contig.name, 0,
-          cls.fasta_reader.query(
-              ranges.make_range(contig.name, 0, contig.n_bases)))
-         for contig in cls.fasta_reader.header.contigs])
+        [(name, 0, bases) for name, bases in cls.fasta_reader.iterate()])
+
+  @classmethod
+  def tearDownClass(cls):
+    for reader_name in _READER_NAMES:
+      getattr(cls, reader_name).__exit__(None, None, None)
 
   def test_non_zero_start_query(self):
     bases = 'ACGTAACCGGTT'
     for start in range(len(bases)):
-      reader = fasta.InMemoryFastaReader([('1', start, bases[start:])])
-      self.assertEqual(reader.header.contigs[0].name, '1')
-      self.assertEqual(reader.header.contigs[0].n_bases, len(bases))
-
-      # Check that our query operation works as expected with a start position.
-      for end in range(start, len(bases)):
-        self.assertEqual(reader.query(ranges.make_range('1', start, end)),
-                         bases[start:end])
+      with fasta.InMemoryFastaReader([('1', start, bases[start:])]) as reader:
+        self.assertEqual(reader.header.contigs[0].name, '1')
+        self.assertEqual(reader.header.contigs[0].n_bases, len(bases))
+
+        # Check that our query operation works as expected with a start
+        # position.
+        full = reader.query(ranges.make_range('1', start, len(bases)))
+        self.assertEqual(full, bases[start:])
+        # Query the boundary ends directly; slicing `full` locally would only
+        # exercise Python string slicing, not the reader's start offset.
+        for end in (start, start + 1):
+          self.assertEqual(reader.query(ranges.make_range('1', start, end)),
+                           bases[start:end])
 
   @parameterized.parameters(
       # Start is 10, so this raises because it's before the bases starts.
@@ -119,18 +185,18 @@ class InMemoryFastaReaderTests(parameterized.TestCase):
       dict(start=12, end=15),
   )
   def test_bad_query_with_start(self, start, end):
-    reader = fasta.InMemoryFastaReader([('1', 10, 'ACGT')])
-    with self.assertRaises(ValueError):
-      reader.query(ranges.make_range('1', start, end))
+    with fasta.InMemoryFastaReader([('1', 10, 'ACGT')]) as reader:
+      with self.assertRaises(ValueError):
+        reader.query(ranges.make_range('1', start, end))
 
   def test_query_edge_cases(self):
-    reader = fasta.InMemoryFastaReader([('1', 0, 'ACGT')])
-    # Check that we can query the first base correctly.
-    self.assertEqual(reader.query(ranges.make_range('1', 0, 1)), 'A')
-    # Check that we can query the last base correctly.
-    self.assertEqual(reader.query(ranges.make_range('1', 3, 4)), 'T')
-    # Check that we can query the entire sequence correctly.
-    self.assertEqual(reader.query(ranges.make_range('1', 0, 4)), 'ACGT')
+    with fasta.InMemoryFastaReader([('1', 0, 'ACGT')]) as reader:
+      # Check that we can query the first base correctly.
+      self.assertEqual(reader.query(ranges.make_range('1', 0, 1)), 'A')
+      # Check that we can query the last base correctly.
+      self.assertEqual(reader.query(ranges.make_range('1', 3, 4)), 'T')
+      # Check that we can query the entire sequence correctly.
+      self.assertEqual(reader.query(ranges.make_range('1', 0, 4)), 'ACGT')
 
   def test_contigs(self):
     # Our contigs can have a different order, descriptions are dropped, etc so
@@ -155,25 +221,19 @@ class InMemoryFastaReaderTests(parameterized.TestCase):
         contig.name for contig in self.fasta_reader.header.contigs]
     expected_lengths = [
         contig.n_bases for contig in self.fasta_reader.header.contigs]
-    in_mem_records = list(self.in_mem.iterate())
+    in_mem_records = tuple(self.in_mem.iterate())
     self.assertLen(in_mem_records, len(self.fasta_reader.header.contigs))
     self.assertEqual([r[0] for r in in_mem_records], expected_names)
     self.assertEqual([len(r[1]) for r in in_mem_records], expected_lengths)
 
     # Check the in-memory fasta file's iterable matches that of the indexed
     # fasta file.
-    fasta_records = list(self.fasta_reader.iterate())
+    fasta_records = _iter_indexed('test.fasta')
     self.assertEqual(in_mem_records, fasta_records)
 
-  @parameterized.parameters(
-      dict(region=ranges.make_range('chr1', 0, 10), expected=True),
-      dict(region=ranges.make_range('chr1', 10, 50), expected=True),
-      dict(region=ranges.make_range('chr1', 10, 500), expected=False),
-      dict(region=ranges.make_range('chr3', 10, 20), expected=False),
-  )
-  def test_is_valid(self, region, expected):
-    self.assertEqual(self.in_mem.is_valid(region), expected)
-    self.assertEqual(self.fasta_reader.is_valid(region), expected)
+  @parameterized.named_parameters(*_per_reader(_IS_VALID_PARAMS))
+  def test_is_valid(self, reader_name, region, expected):
+    self.assertEqual(getattr(self, reader_name).is_valid(region), expected)
 
   def test_known_contig(self):
     for contig in self.fasta_reader.header.contigs:
@@ -183,32 +243,39 @@ class InMemoryFastaReaderTests(parameterized.TestCase):
     self.assertIsInstance(str(self.in_mem), six.string_types)
     self.assertIsInstance(repr(self.in_mem), six.string_types)
 
-  def test_unknown_contig(self):
-    for reader in [self.fasta_reader, self.in_mem]:
-      with self.assertRaises(ValueError):
-        reader.contig('unknown')
+  @parameterized.named_parameters(
+      *[(reader_name, reader_name) for reader_name in _READER_NAMES])
+  def test_unknown_contig(self, reader_name):
+    with self.assertRaises(ValueError):
+      getattr(self, reader_name).contig('unknown')
 
   def test_good_query(self):
     for contig in self.fasta_reader.header.contigs:
-      for start in range(contig.n_bases):
-        for end in range(start, contig.n_bases):
-          region = ranges.make_range(contig.name, start, end)
+      region = ranges.make_range(contig.name, 0, contig.n_bases)
+      full = self.fasta_reader.query(region)
+      full_mem = self.in_mem.query(region)
+      self.assertEqual(full_mem, full)
+
+      # Spot-check a coarse grid of sub-ranges to keep slice-boundary coverage.
+      stride = max(1, contig.n_bases // 16)
+      for start in range(0, contig.n_bases, stride):
+        # Always include ranges that end at the end of the contig.
+        ends = list(range(start, contig.n_bases + 1, stride))
+        if ends[-1] != contig.n_bases:
+          ends.append(contig.n_bases)
+        for end in ends:
+          sub_region = ranges.make_range(contig.name, start, end)
           self.assertEqual(
-              self.in_mem.query(region), self.fasta_reader.query(region))
+              self.in_mem.query(sub_region),
+              self.fasta_reader.query(sub_region))
 
-  @parameterized.parameters(
-      ranges.make_range('chr1', -1, 10),     # bad start.
-      ranges.make_range('chr1', 10, 1),      # end < start.
-      ranges.make_range('chr1', 0, 1000),    # off end of chromosome.
-      ranges.make_range('unknown', 0, 10),   # unknown chromosome.
-  )
-  def test_bad_query(self, region):
-    for reader in [self.fasta_reader, self.in_mem]:
-      with self.assertRaises(ValueError):
-        reader.query(region)
+  @parameterized.named_parameters(*_per_reader(_BAD_QUERY_RANGES))
+  def test_bad_query(self, reader_name, region):
+    with self.assertRaises(ValueError):
+      getattr(self, reader_name).query(region)
 
   def test_bad_create_args(self):
-    with self.assertRaisesRegexp(ValueError, 'multiple ones were found on 1'):
+    with self.assertRaisesRegex(ValueError, 'multiple ones were found on 1'):
       fasta.InMemoryFastaReader([
           ('1', 10, 'AC'),
           ('1', 20, 'AC'),